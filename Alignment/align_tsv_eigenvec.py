@@ -12,7 +12,7 @@ r"""
 
 新增：
 - 自动移除“空/无效 ID”（空串、仅空白、NA、.）的个体，并在两个输出文件中同时剔除，确保一一对应；
-- 若 TSV 中同一对齐后 ID 出现多行，仅保留第一行，其余忽略并提示数量；
+- 若 TSV 中同一对齐后 ID 出现多行，仅保留第一行，其余忽略并提示数量（仅统计 TSV 行，eigenvec 中重复的 ID 不计入）；
 - 保持输出顺序以 eigenvec 为准。
 
 注意与假设：
@@ -38,6 +38,8 @@ r"""
 - --id-col: TSV 中“个体 ID”所在列的索引（0 表示第 1 列，默认 0）。
 - --split-char: 当 TSV 个体名形如 A/B 时，用该分隔符拆分优先匹配 A，其次匹配 B；匹配到谁就保留谁（默认 '/'）。
 - --eigenvec-id: 自动判断或强制指定 eigenvec 的 ID 列（auto/iid/fid）。
+- --filter-finite-eigenvec: 剔除 eigenvec 中 ID 列之后含非有限数（NaN/Inf/非数值）的样本。
+- --filter-finite-tsv-cols: 以逗号分隔的 TSV 列索引（如 1,2），剔除这些列中含非有限数的样本。
 
 运行前小贴士：
 - 若没有 TSV，可先用 pheno/csv_to_tsv.py 将 CSV 转 TSV。
@@ -51,9 +53,10 @@ r"""
 
 import argparse
 import csv
+import math
 import os
 import sys
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
 
 
 def is_empty_id(token: Optional[str]) -> bool:
@@ -61,20 +64,16 @@ def is_empty_id(token: Optional[str]) -> bool:
     return s == "" or s.upper() == "NA" or s == "."
 
 
+_isfinite = math.isfinite
+
+
 def is_finite_number(token: str) -> bool:
     try:
-        import math
-        x = float(str(token).strip())
-        return math.isfinite(x)
+        return _isfinite(float(token))
     except Exception:
         return False
 
 
-def is_empty_id(token: Optional[str]) -> bool:
-    s = (token or "").strip()
-    return s == "" or s.upper() == "NA" or s == "."
-
-
 def try_parse_float(token: str) -> bool:
     try:
         float(token)
@@ -83,6 +82,14 @@ def try_parse_float(token: str) -> bool:
         return False
 
 
+def parse_col_list(value: str) -> List[int]:
+    """解析以逗号分隔的列索引（如 0,2,5），供 --filter-finite-tsv-cols 使用。"""
+    try:
+        return [int(x) for x in value.split(",") if x.strip() != ""]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"应为以逗号分隔的列索引，如 0,2,5（收到：{value}）")
+
+
 def detect_eigenvec_id_mode(first_tokens: List[str]) -> Tuple[str, int, Optional[int]]:
     """基于首行 tokens 自动判断 eigenvec 的 ID 列模式。
 
@@ -110,33 +117,29 @@ def read_eigenvec(
     eigenvec_path: str,
     eigenvec_id_mode: str = "auto",
 ) -> Tuple[Optional[List[str]], List[List[str]], int, Optional[int]]:
-    """读取 eigenvec 文件，检测并保留表头。
+    """读取 eigenvec 文件，检测并保留表头（仅首个非空行可能是表头）。
 
     返回 (header_tokens 或 None, 数据行 tokens 列表, id_idx, fid_idx)。
     """
-    header_tokens: Optional[List[str]] = None
-    data_lines: List[List[str]] = []
-
     def is_header(tokens: List[str]) -> bool:
-        upper = [t.upper() for t in tokens]
-        if any(t in {"FID", "IID"} for t in upper):
-            return True
-        if any(t.startswith("PC") for t in upper):
-            return True
+        # 单次扫描，遇到 FID/IID/PC* 即返回
+        for t in tokens:
+            u = t.upper()
+            if u == "FID" or u == "IID" or u.startswith("PC"):
+                return True
         # 若大部分（>=2）后续列非数值，也可能是表头
         non_numeric = sum(1 for t in tokens[1:] if not try_parse_float(t))
         return non_numeric >= 2
 
+    data_lines: List[List[str]] = []
     with open(eigenvec_path, "r", encoding="utf-8", newline="") as fin:
         for raw in fin:
-            s = raw.strip()
-            if not s:
-                continue
-            tokens = s.split()
-            if header_tokens is None and is_header(tokens):
-                header_tokens = tokens
-                continue
-            data_lines.append(tokens)
+            tokens = raw.split()
+            if tokens:
+                data_lines.append(tokens)
+    header_tokens = data_lines[0] if data_lines and is_header(data_lines[0]) else None
+    if header_tokens is not None:
+        del data_lines[0]
 
     if not data_lines:
         raise ValueError("eigenvec 文件为空或仅包含表头")
@@ -156,73 +159,135 @@ def read_eigenvec(
         raise ValueError("--eigenvec-id 仅支持 auto|iid|fid")
 
 
-def read_tsv(tsv_path: str, id_col: int) -> Tuple[List[str], List[List[str]]]:
-    """读取 TSV，返回 (header, rows)。"""
-    with open(tsv_path, "r", encoding="utf-8-sig", newline="") as fin:
-        reader = csv.reader(fin, delimiter="\t")
-        rows = list(reader)
-    if not rows:
+def iter_tsv_rows(tsv_path: str) -> Iterator[List[str]]:
+    """以 1 MiB 缓冲流式逐行产出 TSV 的行（首行为表头），不整体载入。"""
+    with open(tsv_path, "r", encoding="utf-8-sig", newline="", buffering=1 << 20) as fin:
+        yield from csv.reader(fin, delimiter="\t")
+
+
+def read_tsv(
+    tsv_path: str,
+    id_col: int,
+    eigen_ids: FrozenSet[str],
+    split_char: str,
+) -> Tuple[List[str], List[str], List[List[str]]]:
+    """读取 TSV，返回 (header, 对齐后 ID 列表, 行列表)，两个列表一一对应。
+
+    读取时即按 match_tsv_row 匹配，无法对齐的行直接丢弃；每行只匹配一次，匹配结果随行一并返回
+    （用两个并列列表而非 (ID, 行) 元组，避免额外的容器对象增加 GC 负担）。
+    """
+    rows = iter_tsv_rows(tsv_path)
+    header = next(rows, None)
+    if header is None:
         raise ValueError("TSV 文件为空")
-    header = rows[0]
-    data_rows = rows[1:]
     if id_col < 0 or id_col >= len(header):
         raise ValueError(f"--id-col 超出列范围：{id_col}")
-    return header, data_rows
-
-
-def build_id_map_from_tsv(
-    tsv_rows: List[List[str]],
+    aligned_ids: List[str] = []
+    kept_rows: List[List[str]] = []
+    for row in rows:
+        chosen = match_tsv_row(row, id_col, eigen_ids, split_char)
+        if chosen is not None:
+            aligned_ids.append(chosen)
+            kept_rows.append(row)
+    return header, aligned_ids, kept_rows
+
+
+def match_tsv_row(
+    row: List[str],
     id_col: int,
-    eigen_ids: set,
+    eigen_ids: FrozenSet[str],
     split_char: str,
-) -> Tuple[Dict[str, List[str]], Dict[str, str]]:
-    """从 TSV 行构建映射：已对齐 ID -> 行 (按原顺序收集)，以及 原 ID -> 对齐后 ID。
+) -> Optional[str]:
+    """返回 TSV 行可对齐到的 eigen ID；ID 缺失/无效或无法匹配时返回 None。
 
     当 TSV 的 ID 含分隔符时，拆分两部分进行与 eigen IDs 的对比；
     - 若 part1 命中，则使用 part1；若 part2 命中，则使用 part2；两者都命中时优先 part1；
-    - 若均未命中但完整 ID 命中，也可保留完整 ID；否则丢弃该行（无法对齐）。
+    - 若均未命中但完整 ID 命中，也可保留完整 ID；否则无法对齐。
     """
-    aligned_id_to_rows: Dict[str, List[str]] = {}
-    original_to_aligned: Dict[str, str] = {}
+    if id_col >= len(row):
+        return None
+    raw_id = (row[id_col] or "").strip()
+    if is_empty_id(raw_id):
+        return None
+
+    if split_char and split_char in raw_id:
+        # 优先匹配第一个部分，再匹配第二个部分；逐个尝试，命中即返回
+        for p in raw_id.split(split_char):
+            p = p.strip()
+            if p and p in eigen_ids:
+                return p
+    # 回退：完整 ID 直接命中也允许
+    if raw_id in eigen_ids:
+        return raw_id
+    return None
 
-    for row in tsv_rows:
-        if id_col >= len(row):
-            continue
-        raw_id = (row[id_col] or "").strip()
-        if is_empty_id(raw_id):
-            continue
 
-        chosen: Optional[str] = None
-        if split_char and split_char in raw_id:
-            parts = [p.strip() for p in raw_id.split(split_char) if p.strip()]
-            # 优先匹配第一个部分，再匹配第二个部分
-            for p in parts:
-                if p in eigen_ids:
-                    chosen = p
-                    break
-        # 回退：完整 ID 直接命中也允许
-        if chosen is None and raw_id in eigen_ids:
-            chosen = raw_id
+def build_id_map_from_tsv(
+    aligned_ids: List[str],
+    tsv_rows: List[List[str]],
+    id_col: int,
+) -> Tuple[Dict[str, List[str]], Dict[str, str], int]:
+    """从 read_tsv 返回的对齐后 ID 与行构建映射：已对齐 ID -> 首条行，原 ID -> 对齐后 ID，以及被忽略的重复行数。
 
-        if chosen is None:
-            continue  # 无法对齐的个体，丢弃
+    同一对齐后 ID 仅保留首次出现的行（按对齐 ID 去重、保留第一条），后续行只计数不保存。
+    返回的重复行数只统计“多条 TSV 行对齐到同一 ID”的情况；eigenvec 中重复出现的 ID 不计入。
+    注意：保留行的 ID 列会被原地改写为对齐后 ID（不复制行），调用方不应再使用原始行内容。
+    """
+    aligned_id_to_row: Dict[str, List[str]] = {}
+    original_to_aligned: Dict[str, str] = {}
+    duplicates = 0
+
+    for chosen, row in zip(aligned_ids, tsv_rows):
+        # eigen IDs 已驻留，驻留后的键与其为同一对象，后续按 eigen 顺序查表可走指针相等的快速路径
+        chosen = sys.intern(chosen)
 
-        original_to_aligned[raw_id] = chosen
-        # 将行的 ID 替换为对齐后的 ID
-        new_row = list(row)
-        new_row[id_col] = chosen
-        aligned_id_to_rows.setdefault(chosen, []).append(new_row)
+        original_to_aligned[row[id_col].strip()] = chosen
+        if chosen in aligned_id_to_row:
+            duplicates += 1
+            continue
+        # 将行的 ID 原地替换为对齐后的 ID
+        if row[id_col] != chosen:
+            row[id_col] = chosen
+        aligned_id_to_row[chosen] = row
 
-    return aligned_id_to_rows, original_to_aligned
+    return aligned_id_to_row, original_to_aligned, duplicates
 
 
-def write_tsv(path: str, header: List[str], rows: List[List[str]]):
-    with open(path, "w", encoding="utf-8", newline="") as fout:
+def write_tsv(path: str, header: List[str], rows: Iterable[List[str]]):
+    """写出 TSV；rows 可为任意可迭代对象（如生成器），以 1 MiB 缓冲流式写出。"""
+    with open(path, "w", encoding="utf-8", newline="", buffering=1 << 20) as fout:
         writer = csv.writer(fout, delimiter="\t", lineterminator="\n")
         writer.writerow(header)
         writer.writerows(rows)
 
 
+def write_eigenvec(
+    path: str,
+    header_tokens: Optional[List[str]],
+    rows: Iterable[Tuple[List[str], str]],
+    fid_idx: Optional[int],
+) -> None:
+    """写出对齐后的 eigenvec，rows 为 (原行 tokens, 对齐后 ID)。
+
+    read_eigenvec 给出的 ID 列总在行首（[IID, PCs...] 或 [FID, IID, PCs...]），
+    因此每行直接以对齐后 ID 拼接其余 tokens，不复制 tokens 列表；所有行经一次 writelines 写出。
+    """
+    lead = 1 if fid_idx is None else 2
+
+    def lines():
+        for tokens, chosen_id in rows:
+            head = chosen_id if lead == 1 else chosen_id + " " + chosen_id
+            if len(tokens) > lead:
+                yield head + " " + " ".join(tokens[lead:]) + "\n"
+            else:
+                yield head + "\n"
+
+    with open(path, "w", encoding="utf-8", newline="\n", buffering=1 << 20) as fout:
+        if header_tokens is not None:
+            fout.write(" ".join(header_tokens) + "\n")
+        fout.writelines(lines())
+
+
 def main():
     parser = argparse.ArgumentParser(description="将 TSV 与 eigenvec 个体对齐（名称与顺序一致）")
     parser.add_argument("--tsv", required=True, help="输入 TSV 文件路径（行=个体，包含个体 ID 列）")
@@ -232,6 +297,8 @@ def main():
     parser.add_argument("--id-col", type=int, default=0, help="TSV 中个体 ID 所在列（从 0 开始，默认 0）")
     parser.add_argument("--split-char", default="/", help="TSV 个体名分隔符（默认 '/'）")
     parser.add_argument("--eigenvec-id", choices=["auto", "iid", "fid"], default="auto", help="eigenvec 使用的 ID 列：auto 自动检测，或强制使用 iid/fid")
+    parser.add_argument("--filter-finite-eigenvec", action="store_true", help="剔除 eigenvec 中含非有限数（NaN/Inf）的样本")
+    parser.add_argument("--filter-finite-tsv-cols", type=parse_col_list, default=[], help="以逗号分隔的 TSV 列索引（如 1,2），剔除这些列含非有限数的样本")
 
     args = parser.parse_args()
 
@@ -253,7 +320,7 @@ def main():
 
     # 可选：过滤 eigenvec 中含非有限数（NaN/Inf）的样本行
     removed_nonfinite_eigen = 0
-    if '--filter-finite-eigenvec' in sys.argv:
+    if args.filter_finite_eigenvec:
         cleaned = []
         for tok in eigen_lines:
             ok = True
@@ -267,25 +334,18 @@ def main():
                 removed_nonfinite_eigen += 1
         eigen_lines = cleaned
 
-    eigen_ids_in_order: List[str] = [tok[id_idx] for tok in eigen_lines]
-    eigen_id_set = set(eigen_ids_in_order)
+    eigen_ids_in_order: List[str] = [sys.intern(tok[id_idx]) for tok in eigen_lines]
+    eigen_id_set = frozenset(eigen_ids_in_order)
 
-    # 读取 TSV 并根据 eigen IDs 构建映射
-    header, tsv_rows = read_tsv(args.tsv, args.id_col)
-    # 可选：基于指定列过滤 TSV 的非有限数样本（以命令行原始参数触发，避免破坏现有接口）
+    # 读取 TSV：读取时即与 eigen IDs 匹配并丢弃无法对齐的行，再根据匹配结果构建映射
+    header, tsv_aligned_ids, tsv_rows = read_tsv(args.tsv, args.id_col, eigen_id_set, args.split_char)
+    # 可选：基于指定列过滤 TSV 的非有限数样本
     removed_nonfinite_tsv = 0
-    tsv_cols_arg_prefix = '--filter-finite-tsv-cols='
-    raw_arg = next((a for a in sys.argv if a.startswith(tsv_cols_arg_prefix)), None)
-    cols_idx: List[int] = []
-    if raw_arg is not None:
-        try:
-            cols_idx = [int(x) for x in raw_arg[len(tsv_cols_arg_prefix):].split(',') if str(x).strip() != '']
-        except Exception:
-            print("[Error] --filter-finite-tsv-cols 解析失败，应为以逗号分隔的列索引，如 0,2,5")
-            sys.exit(1)
+    cols_idx: List[int] = args.filter_finite_tsv_cols
     if cols_idx:
+        filtered_ids: List[str] = []
         filtered_rows: List[List[str]] = []
-        for row in tsv_rows:
+        for aligned_id, row in zip(tsv_aligned_ids, tsv_rows):
             ok = True
             for ci in cols_idx:
                 if ci < 0 or ci >= len(row):
@@ -294,44 +354,27 @@ def main():
                     ok = False
                     break
             if ok:
+                filtered_ids.append(aligned_id)
                 filtered_rows.append(row)
             else:
                 removed_nonfinite_tsv += 1
+        tsv_aligned_ids = filtered_ids
         tsv_rows = filtered_rows
-    aligned_id_to_rows, original_to_aligned = build_id_map_from_tsv(
+    aligned_id_to_row, original_to_aligned, skipped_due_to_dup = build_id_map_from_tsv(
+        aligned_ids=tsv_aligned_ids,
         tsv_rows=tsv_rows,
         id_col=args.id_col,
-        eigen_ids=eigen_id_set,
-        split_char=args.split_char,
     )
 
-    # 按 eigenvec 顺序生成对齐后的 TSV 与 eigenvec
-    aligned_tsv_rows: List[List[str]] = []
-    aligned_eigen_lines: List[str] = []
-
-    kept = 0
-    skipped_due_to_dup = 0
-    for tokens in eigen_lines:
-        eigen_id = tokens[id_idx]
-        if eigen_id not in aligned_id_to_rows:
+    # 按 eigenvec 顺序配对 (eigenvec 行, TSV 行)，仅保存引用，写出时再生成两个文件的内容
+    aligned: List[Tuple[List[str], List[str]]] = []
+    for eigen_id, tokens in zip(eigen_ids_in_order, eigen_lines):
+        # 该 eigen_id 对应的第一条 TSV 行（重复行已在构建映射时忽略）
+        row = aligned_id_to_row.get(eigen_id)
+        if row is None:
             continue  # 个体不在 TSV 中（或未能匹配），跳过
-
-        # 选择该 eigen_id 对应的第一条 TSV 行（如有重复，仅保留第一条）
-        rows_for_id = aligned_id_to_rows[eigen_id]
-        row = rows_for_id[0]
-        if len(rows_for_id) > 1:
-            skipped_due_to_dup += len(rows_for_id) - 1
-        aligned_tsv_rows.append(row)
-
-        # 构造新的 eigenvec 行：将 ID 统一为 row[id_col]
-        chosen_id = row[args.id_col]
-        new_tokens = list(tokens)
-        if fid_idx is not None and 0 <= fid_idx < len(new_tokens):
-            new_tokens[fid_idx] = chosen_id
-        if id_idx is not None and 0 <= id_idx < len(new_tokens):
-            new_tokens[id_idx] = chosen_id
-        aligned_eigen_lines.append(" ".join(new_tokens))
-        kept += 1
+        aligned.append((tokens, row))
+    kept = len(aligned)
 
     if kept == 0:
         print("[Error] 没有找到可对齐的个体（交集为空）。请检查 ID 列与分隔符设置。")
@@ -340,12 +383,14 @@ def main():
     # 写出文件
     os.makedirs(os.path.dirname(args.out_tsv) or ".", exist_ok=True)
     os.makedirs(os.path.dirname(args.out_eigenvec) or ".", exist_ok=True)
-    write_tsv(args.out_tsv, header, aligned_tsv_rows)
-    with open(args.out_eigenvec, "w", encoding="utf-8", newline="\n") as fout:
-        if header_tokens is not None:
-            fout.write(" ".join(header_tokens) + "\n")
-        for line in aligned_eigen_lines:
-            fout.write(line + "\n")
+    write_tsv(args.out_tsv, header, (row for _, row in aligned))
+    # 新的 eigenvec 行将 ID 统一为 row[id_col]
+    write_eigenvec(
+        args.out_eigenvec,
+        header_tokens,
+        ((tokens, row[args.id_col]) for tokens, row in aligned),
+        fid_idx,
+    )
 
     print(f"[Done] 对齐完成：保留个体 {kept} 个")
     if removed_eigen_empty > 0:
@@ -4,9 +4,11 @@ r"""
 特性：
 - 自动或手动指定输入格式（auto/eigenvec/csv/tsv）；
 - eigenvec 支持含表头（FID IID PC1 ...），可选丢弃 FID/#FID 列；
-- 将 PCA/数值列可选下采样为 float32，减少内存/加快序列化；
-- 优先使用 pyarrow 引擎读取 CSV/TSV（如可用），否则使用 C 引擎；
-- 使用更高的 pickle 协议保存（旧版自动回退）。
+- 将 PCA/数值列可选下采样为 float32，减少内存/加快序列化（预先确定列类型，读取时直接解析为 float32）；
+- 优先使用 pyarrow 引擎读取 CSV/TSV 及制表符分隔的 eigenvec（如可用），否则使用 C 引擎；
+- 使用更高的 pickle 协议保存（旧版自动回退）；可选 --pickle-oob 以协议 5 带外缓冲写出大型数值矩阵
+  （该格式需使用本脚本的 load_pickle_oob 读取，DNNGP 不能直接读取）；
+- 可选输出为 Parquet / Feather（zstd 压缩的列式格式，体积更小、支持按列加载，需要 pyarrow）。
 
 示例：
   python tsv2pkl.py \
@@ -18,12 +20,19 @@ r"""
     --input C:\\Users\\Cloud\\Desktop\\showANDdnngp\\pheno\\maize.hybrid.train_phe.tsv \
     --output C:\\Users\\Cloud\\Desktop\\showANDdnngp\\pheno\\maize.hybrid.train_phe.pkl \
     --format tsv --index-col 0 --downcast-floats
+
+  python tsv2pkl.py \
+    --input C:\\Users\\Cloud\\Desktop\\showANDdnngp\\Alignment\\pca250.aligned.eigenvec \
+    --output C:\\Users\\Cloud\\Desktop\\showANDdnngp\\Alignment\\pca250.parquet \
+    --format eigenvec --output-format parquet
 """
 
 import argparse
 import os
+import pickle
+import struct
 import sys
-from typing import Optional
+from typing import Dict, List, Optional
 
 import pandas as pd
 
@@ -39,16 +48,79 @@ def choose_engine_for_sep(sep: str) -> Optional[str]:
     return "c"
 
 
+def read_header_line(input_path: str) -> str:
+    """返回文件的首个非空行（即表头行），用于在正式读取前确定列名与分隔符。"""
+    with open(input_path, "r", encoding="utf-8-sig") as fin:
+        return next((line for line in fin if line.strip()), "")
+
+
+def sample_float_columns(input_path: str, sep: str, nrows: int = 1000) -> List[str]:
+    """读取前 nrows 行推断浮点列，供正式读取时直接以 float32 解析。"""
+    sample = pd.read_csv(input_path, sep=sep, header=0, engine="c", nrows=nrows)
+    return list(sample.select_dtypes(include=["float64", "float32"]).columns)
+
+
 def try_pickle(df: pd.DataFrame, path: str) -> None:
     """以尽量高协议写出 PKL，兼容旧版 pandas。"""
     try:
-        import pickle
         protocol = max(4, pickle.HIGHEST_PROTOCOL)
         df.to_pickle(path, protocol=protocol)
     except TypeError:
         df.to_pickle(path)
 
 
+OOB_MAGIC = b"PKLOOB5\n"
+
+
+def pickle_oob(df: pd.DataFrame, path: str) -> None:
+    """以 pickle 协议 5 写出，数值列的连续内存作为带外缓冲直接写入文件，不经 pickle 流复制。
+
+    文件布局：魔数 | 主数据长度、缓冲区个数 | 各缓冲区长度 | 主数据 | 各缓冲区。
+    """
+    buffers: List[pickle.PickleBuffer] = []
+    data = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+    raws = [buf.raw() for buf in buffers]
+    with open(path, "wb", buffering=1 << 20) as fout:
+        fout.write(OOB_MAGIC)
+        fout.write(struct.pack("<QQ", len(data), len(raws)))
+        fout.write(struct.pack(f"<{len(raws)}Q", *(raw.nbytes for raw in raws)))
+        fout.write(data)
+        for raw in raws:
+            fout.write(raw)
+
+
+def load_pickle_oob(path: str) -> pd.DataFrame:
+    """读取 pickle_oob 写出的文件。"""
+    with open(path, "rb") as fin:
+        if fin.read(len(OOB_MAGIC)) != OOB_MAGIC:
+            raise ValueError("不是 --pickle-oob 格式的文件：" + path)
+        data_len, n_buffers = struct.unpack("<QQ", fin.read(16))
+        sizes = struct.unpack(f"<{n_buffers}Q", fin.read(8 * n_buffers))
+        data = fin.read(data_len)
+        if len(data) != data_len:
+            raise ValueError("--pickle-oob 文件被截断：" + path)
+        buffers = []
+        for size in sizes:
+            buf = bytearray(size)
+            if fin.readinto(buf) != size:
+                raise ValueError("--pickle-oob 文件被截断：" + path)
+            buffers.append(buf)
+    return pickle.loads(data, buffers=buffers)
+
+
+def write_output(df: pd.DataFrame, path: str, output_format: str, pickle_oob_buffers: bool = False) -> None:
+    """按输出格式写出：pkl（默认，DNNGP 直接读取）、parquet 或 feather。"""
+    if output_format == "parquet":
+        df.to_parquet(path, engine="pyarrow", compression="zstd", compression_level=3)
+    elif output_format == "feather":
+        # feather 不保存 pandas 索引，将索引还原为普通列后写出
+        df.reset_index().to_feather(path, compression="zstd")
+    elif pickle_oob_buffers:
+        pickle_oob(df, path)
+    else:
+        try_pickle(df, path)
+
+
 def load_dataframe(
     input_path: str,
     fmt: str,
@@ -71,16 +143,25 @@ def load_dataframe(
             fmt = "tsv"
 
     if fmt == "eigenvec":
-        # 空白分隔，可能含表头（FID IID PC1 ...）
-        df = pd.read_csv(
-            input_path,
-            delim_whitespace=True,
-            header=0,
-            engine="c",
-        )
-        # 兼容旧数据集名 '#FID'
-        fid_like_cols = [c for c in df.columns if c.upper() in {"FID", "#FID"}]
-        iid_like_cols = [c for c in df.columns if c.upper() in {"IID", "#IID"}]
+        # 空白分隔，可能含表头（FID IID PC1 ...）；PC 列在读取时直接解析为 float32
+        header_line = read_header_line(input_path)
+        pc_dtype: Dict[str, str] = {c: "float32" for c in header_line.split() if c.upper().startswith("PC")}
+        # plink2 输出为制表符分隔，可交给 pyarrow 引擎；其它空白分隔使用 C 引擎
+        if "\t" in header_line and choose_engine_for_sep("\t") == "pyarrow":
+            sep, engine = "\t", "pyarrow"
+        else:
+            sep, engine = r"\s+", "c"
+        try:
+            df = pd.read_csv(input_path, sep=sep, header=0, engine=engine, dtype=pc_dtype)
+            coerce_pc = False
+        except ValueError:
+            # PC 列含无法解析的值：按文本读取，随后强制转换（无法解析者置为 NaN）
+            df = pd.read_csv(input_path, sep=r"\s+", header=0, engine="c")
+            coerce_pc = True
+        # 列名只大写一次，供 FID/IID/PC 列识别复用；兼容旧数据集名 '#FID'
+        upper = {c: c.upper() for c in df.columns}
+        fid_like_cols = [c for c, u in upper.items() if u in {"FID", "#FID"}]
+        iid_like_cols = [c for c, u in upper.items() if u in {"IID", "#IID"}]
 
         # 选择索引列：优先 IID；否则根据用户指定；再否则根据位置
         id_col_name: Optional[str] = None
@@ -92,7 +173,7 @@ def load_dataframe(
             id_col_name = df.columns[index_col_pos]
         else:
             # 常见：['FID','IID','PC1',...] 或 ['IID','PC1',...]
-            if len(df.columns) >= 2 and df.columns[1].upper() in {"IID", "#IID"}:
+            if len(df.columns) >= 2 and upper[df.columns[1]] in {"IID", "#IID"}:
                 id_col_name = df.columns[1]
             else:
                 id_col_name = df.columns[0]
@@ -101,24 +182,29 @@ def load_dataframe(
         if drop_fid and fid_like_cols:
             df = df.drop(columns=fid_like_cols)
 
-        # 将以 PC 开头的列尽量转为 float32
-        pc_cols = [c for c in df.columns if c.upper().startswith("PC")]
-        for c in pc_cols:
-            new_col = pd.to_numeric(df[c], errors="coerce")
-            df[c] = new_col.astype("float32")
+        # 将以 PC 开头的列尽量转为 float32（常规情况下读取时已完成）
+        if coerce_pc:
+            pc_cols = [c for c in df.columns if upper[c].startswith("PC")]
+            if pc_cols:
+                # 整块转换后一次性写回，避免逐列赋值带来的多次块重组
+                df[pc_cols] = df[pc_cols].apply(pd.to_numeric, errors="coerce").astype("float32")
 
-        df = df.set_index(id_col_name)
+        # copy() 将逐列解析产生的碎片数据块合并为一块，PKL 更小、写出更快
+        df = df.set_index(id_col_name).copy()
         return df
 
     elif fmt in {"csv", "tsv"}:
         sep = "," if fmt == "csv" else "\t"
         engine = choose_engine_for_sep(sep)
-        df = pd.read_csv(
-            input_path,
-            sep=sep,
-            header=0,
-            engine=engine,
-        )
+        # 下采样时先按样本行推断浮点列，读取时直接解析为 float32，避免 float64 -> float32 的整列复制
+        float_dtype: Optional[Dict[str, str]] = None
+        if downcast_floats:
+            float_dtype = {c: "float32" for c in sample_float_columns(input_path, sep)}
+        try:
+            df = pd.read_csv(input_path, sep=sep, header=0, engine=engine, dtype=float_dtype)
+        except ValueError:
+            # 样本之后出现非数值：按推断类型读取
+            df = pd.read_csv(input_path, sep=sep, header=0, engine=engine)
 
         # 索引列：优先列名、其次位置、最后默认第 0 列
         if index_col is not None and index_col in df.columns:
@@ -129,11 +215,13 @@ def load_dataframe(
             id_col_name = df.columns[0]
 
         if downcast_floats:
-            float_cols = df.select_dtypes(include=["float64", "float32"]).columns
+            # 兜底：样本中未识别为浮点、但整列实际为浮点的列
+            float_cols = df.select_dtypes(include=["float64"]).columns
             if len(float_cols) > 0:
                 df[float_cols] = df[float_cols].astype("float32")
 
-        df = df.set_index(id_col_name)
+        # copy() 将逐列解析产生的碎片数据块合并为一块，PKL 更小、写出更快
+        df = df.set_index(id_col_name).copy()
         return df
 
     else:
@@ -143,14 +231,18 @@ def load_dataframe(
 def main():
     parser = argparse.ArgumentParser(description="高性能 TSV/CSV/eigenvec -> PKL 转换")
     parser.add_argument("--input", required=True, help="输入文件路径（tsv/csv/eigenvec）")
-    parser.add_argument("--output", required=True, help="输出 PKL 路径")
+    parser.add_argument("--output", required=True, help="输出文件路径（PKL/Parquet/Feather，见 --output-format）")
     parser.add_argument("--format", choices=["auto", "eigenvec", "csv", "tsv"], default="auto", help="输入格式（默认 auto 自动检测）")
     parser.add_argument("--index-col", dest="index_col", default=None, help="指定索引列名（优先级高于 --index-col-pos）")
     parser.add_argument("--index-col-pos", dest="index_col_pos", type=int, default=None, help="指定索引列位置（0 起始）")
     parser.add_argument("--drop-fid", action="store_true", help="eigenvec 输入时丢弃 FID/#FID 列")
     parser.add_argument("--downcast-floats", action="store_true", help="将数值列下采样为 float32 以减少体积")
+    parser.add_argument("--output-format", choices=["pkl", "parquet", "feather"], default="pkl", help="输出格式（默认 pkl；parquet/feather 需要 pyarrow）")
+    parser.add_argument("--pickle-oob", action="store_true", help="pkl 输出使用协议 5 带外缓冲（更快，需用 load_pickle_oob 读取）")
 
     args = parser.parse_args()
+    if args.pickle_oob and args.output_format != "pkl":
+        parser.error("--pickle-oob 仅适用于 --output-format pkl")
 
     if not os.path.isfile(args.input):
         print(f"[Error] 输入文件不存在: {args.input}")
@@ -177,12 +269,12 @@ def main():
 
     print(f"[Info] 行数: {len(df):,} 列数: {len(df.columns):,}")
     try:
-        try_pickle(df, args.output)
+        write_output(df, args.output, args.output_format, pickle_oob_buffers=args.pickle_oob)
     except Exception as e:
         print(f"[Error] 保存失败: {e}")
         sys.exit(3)
 
-    print(f"[Done] 已保存 PKL: {args.output}")
+    print(f"[Done] 已保存 {args.output_format.upper()}: {args.output}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+"""
+hapmap_to_vcf.py 的可选 Numba 加速内核。
+
+仅在安装了 Numba 时由 hapmap_to_vcf.py 延迟导入；未安装时该脚本回退到 NumPy/纯 Python 路径，输出一致。
+"""
+
+import numba
+import numpy as np
+
+
+@numba.njit(parallel=True, cache=True)
+def encode_site(gt_codes, index_by_nibble):
+    """将一个位点的打包基因型码编码为以制表符连接的 "i/j" ASCII 字节。
+
+    gt_codes 每个样本一个字节（高 4 位为等位基因 1，低 4 位为等位基因 2）；index_by_nibble 给出
+    每个 4 位碱基码对应的 REF/ALT 下标，-1 表示不在其中，此时输出 "./."。
+    """
+    n = gt_codes.size
+    out = np.empty(max(4 * n - 1, 0), dtype=np.uint8)
+    for k in numba.prange(n):
+        code = gt_codes[k]
+        i = index_by_nibble[code >> 4]
+        j = index_by_nibble[code & 0x0F]
+        o = 4 * k
+        if i < 0 or j < 0:
+            out[o] = 46  # '.'
+            out[o + 2] = 46
+        else:
+            out[o] = 48 + i  # '0' + index
+            out[o + 2] = 48 + j
+        out[o + 1] = 47  # '/'
+        if k < n - 1:
+            out[o + 3] = 9  # '\t'
+    return out
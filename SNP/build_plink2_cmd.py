@@ -16,33 +16,49 @@
 在--out-dir 参数中填入输出目录（可选，不填则默认当前工作目录）。
 在--threads 参数中填入线程数。
 输出文件为 pca10.eigenvec 和 pca10.eigenval；可通过 --out-dir 指定输出目录。
+打印的命令在 POSIX 下按 shlex 规则、在 Windows 下按 subprocess.list2cmdline 规则加引号
+（含 cmd.exe 元字符 & | < > ( ) ^ % ! 的参数另外整体加双引号）；
+在 Python 中也可调用 build_plink2_args 取得参数列表，直接传给 subprocess.run。
 """
 import argparse
+import os
+import shlex
+import subprocess
 from typing import List
 
 
-def needs_quotes(value: str) -> bool:
-    """判断参数值是否需要加引号。
+def quote_vcf_pattern(vcf_pattern: str) -> str:
+    """POSIX 下为 --vcf 参数加引号，但保留纯通配模式（例如 *.vcf）不加引号，以便 shell 展开。"""
+    masked = vcf_pattern.replace('*', '_').replace('?', '_')
+    if masked != vcf_pattern and shlex.quote(masked) == masked:
+        return vcf_pattern
+    return shlex.quote(vcf_pattern)
 
-    规则：
-    - 如果包含空格或常见会打断命令的特殊字符，则需要加引号；
-    - 对于纯通配模式（例如 *.vcf），默认不加引号，以便在支持的 shell 中让通配符展开。
-    """
-    if value is None:
-        return False
-    special = set(' <>|&()')
-    if any(ch in special for ch in value):
-        return True
-    return ' ' in value
+
+WINDOWS_SHELL_METACHARS = frozenset('&|<>()^%!')
+
+
+def quote_windows_arg(arg: str) -> str:
+    """Windows 下按 list2cmdline 规则转义单个参数；含 cmd.exe 元字符时整体加双引号，避免被 cmd 解释。"""
+    quoted = subprocess.list2cmdline([arg])
+    if quoted.startswith('"') or WINDOWS_SHELL_METACHARS.isdisjoint(quoted):
+        return quoted
+    # 结尾的反斜杠需加倍，否则会转义收尾的双引号
+    n_trailing = len(quoted) - len(quoted.rstrip('\\'))
+    return '"' + quoted + '\\' * n_trailing + '"'
 
 
-def quote(value: str) -> str:
-    """根据需要为参数加引号。"""
-    if value is None:
-        return ''
-    if needs_quotes(value):
-        return f'"{value}"'
-    return value
+def build_plink2_args(plink2_path: str, threads: int, vcf_pattern: str, pca_k: int, out_prefix: str, out_dir: str | None) -> List[str]:
+    """根据输入参数构建 plink2 参数列表（可直接传给 subprocess.run，无需再经 shell 解析）。"""
+    # 组合输出路径（目录 + 前缀）；不在此处添加扩展名，由 plink2 自行追加 .eigenvec/.eigenval
+    full_out = out_dir.rstrip('/\\') + '/' + out_prefix if out_dir else out_prefix
+    return [
+        plink2_path,
+        "--threads", str(threads),
+        "--vcf", vcf_pattern,
+        "--pca", str(pca_k),
+        "--out", full_out,
+    ]
 
 
 def build_plink2_command(plink2_path: str, threads: int, vcf_pattern: str, pca_k: int, out_prefix: str, out_dir: str | None) -> str:
@@ -55,23 +71,12 @@ def build_plink2_command(plink2_path: str, threads: int, vcf_pattern: str, pca_k
     - pca_k: 主成分个数（--pca 的 K 值）；
     - out_prefix: 输出前缀（--out）。
     """
-    tokens: List[str] = []
-    # 第一个 token：plink2 可执行文件路径（若包含空格会自动加引号）
-    tokens.append(quote(plink2_path))
-    tokens.extend(["--threads", str(threads)])
-    # 对于包含 * 或 ? 的通配模式，保持原样以便在支持的 shell 中进行展开；
-    # 若传入的是具体路径（可能含空格），会自动加引号。
-    vcf_token = vcf_pattern if ('*' in vcf_pattern or '?' in vcf_pattern) else quote(vcf_pattern)
-    tokens.extend(["--vcf", vcf_token])
-    tokens.extend(["--pca", str(pca_k)])
-    # 组合输出路径（目录 + 前缀）
-    if out_dir:
-        # 不在此处添加扩展名，由 plink2 自行追加 .eigenvec/.eigenval
-        full_out = quote(out_dir.rstrip('/\\') + '/' + out_prefix)
-    else:
-        full_out = quote(out_prefix)
-    tokens.extend(["--out", full_out])
-    return " ".join(tokens)
+    args = build_plink2_args(plink2_path, threads, vcf_pattern, pca_k, out_prefix, out_dir)
+    if os.name == "nt":
+        # Windows：按 MSVC 运行库规则加引号，并保护 cmd.exe 元字符
+        return " ".join(quote_windows_arg(a) for a in args)
+    # POSIX：逐个参数用 shlex.quote 转义；--vcf 的通配模式保持原样以便 shell 展开
+    return " ".join(quote_vcf_pattern(a) if prev == "--vcf" else shlex.quote(a) for prev, a in zip([""] + args, args))
 
 
 def main():
@@ -4,7 +4,9 @@ HapMap(hmp.txt) -> VCF 转换脚本（中文使用说明）
 功能：
 - 解析 HapMap 格式（hmp.txt）的标记与样本基因型，输出符合 VCFv4.2 的文件；
 - 识别等位基因字段（如 A/C、AC、A|C），支持 IUPAC 简并码（R,Y,W,S,K,M 等）；
-- 缺失/不确定基因型输出为 ./.；单态位点 ALT 列输出为 .；格式列为 GT。
+- 缺失/不确定基因型输出为 ./.；单态位点 ALT 列输出为 .；格式列为 GT；
+- 若已安装 NumPy，样本基因型均为等宽（单字符 IUPAC 或双字符如 AG）的行以查找表整行向量化解析，否则逐格解析，结果一致；
+- 若另装有 Numba，GT 编码由 SNP/_hapmap_jit.py 中的 JIT 内核完成（延迟导入，可选）。
 
 示例（Windows）：
   1) 在仓库根目录运行（使用默认示例文件，默认输出到 `SNP/origin_maize.geno.selected.vcf`）：
@@ -22,35 +24,68 @@ HapMap(hmp.txt) -> VCF 转换脚本（中文使用说明）
          "C:\\path\\to\\input.hmp.txt" `
          "C:\\path\\to\\output.vcf"
 
+  4) 多进程并行转换（按字节区间切分输入，输出与单进程完全一致）：
+       python .\\SNP\\hapmap_to_vcf.py input.hmp.txt output.vcf --threads 8
+
+  5) 压缩输出（以 .vcf.gz 或 .vcf.bgz 结尾）：装有 pysam 时写 BGZF，可加 --tabix 建立索引；否则写普通 gzip：
+       python .\\SNP\\hapmap_to_vcf.py input.hmp.txt output.vcf.gz --tabix
+
+  6) 仅转换部分样本，并每 10000 行刷新一次输出：
+       python .\\SNP\\hapmap_to_vcf.py input.hmp.txt output.vcf --samples S1,S2,S3 --chunksize 10000
+
 说明：
 - 输入必须是标准 HapMap 列表头（前 11 列为元数据，样本列从第 12 列开始）。
 - 若 Alleles 列无法提供 REF/ALT，将从首个非缺失基因型中推断 REF，并收集 ALT；若仍无法判断，REF 用 N。
+- 若位点所有基因型的碱基都已列在 Alleles 列中，直接以该列作为 REF/ALT（单遍，结果不变）；
+  加 --trust-alleles 时跳过该检查，Alleles 列之外碱基的基因型输出为 ./.。
 - 输出文件首部包含 VCF 头，FORMAT 仅含 GT（基因型）。
 """
 
+import argparse
+import gzip
+import importlib.util
+import mmap
 import os
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
+from functools import lru_cache
+
+try:  # Optional: vectorized genotype decoding via byte lookup tables
+    import numpy as np
+except ImportError:
+    np = None
+
+try:  # Optional: BGZF-compressed (tabix-indexable) .vcf.gz output
+    import pysam
+except ImportError:
+    pysam = None
 
 
-def parse_alleles_field(alleles_raw: str) -> list:
-    """Parse HapMap alleles field into an ordered list of unique bases.
+# Upper-case a/c/g/t, keep A/C/G/T and delete every other ASCII character (separators, N, ...)
+ALLELE_BASES = str.maketrans(
+    {chr(i): None for i in range(128) if chr(i) not in "ACGTacgt"} | {c: c.upper() for c in "acgt"}
+)
+
+
+@lru_cache(maxsize=256)
+def parse_alleles_field(alleles_raw: str) -> tuple:
+    """Parse HapMap alleles field into an ordered tuple of unique bases.
 
     Accepts formats like "A/C", "AC", "A C", or "A|C". Returns only A,C,G,T.
-    The first base is treated as REF, the rest as ALT(s).
+    The first base is treated as REF, the rest as ALT(s). Cached: an Alleles
+    column only holds a handful of distinct strings.
     """
     if not alleles_raw:
-        return []
-    tokens = []
-    for ch in alleles_raw.replace('/', ' ').replace('|', ' ').replace(',', ' ').split():
-        for c in ch:
-            tokens.append(c.upper())
-
-    ordered = []
-    for b in tokens:
-        if b in {"A", "C", "G", "T"} and b not in ordered:
-            ordered.append(b)
-    return ordered
+        return ()
+    # Separators need no special handling: anything that is not a base is dropped
+    # by the translate table, so dict.fromkeys only sees bases (order-preserving dedup in C).
+    bases = alleles_raw.translate(ALLELE_BASES)
+    if not bases.isascii():
+        bases = filter("ACGT".__contains__, bases)
+    return tuple(dict.fromkeys(bases))
 
 
 IUPAC_MAP = {
@@ -73,6 +108,23 @@ IUPAC_MAP = {
 }
 
 
+# Single-character IUPAC code -> normalized genotype (None for 0 or >2 bases)
+IUPAC_GENOTYPES = {}
+for _code, _bases in IUPAC_MAP.items():
+    if len(_bases) == 1:
+        IUPAC_GENOTYPES[_code] = (next(iter(_bases)),) * 2
+    elif len(_bases) == 2:
+        IUPAC_GENOTYPES[_code] = tuple(sorted(_bases))  # deterministic order
+    else:
+        IUPAC_GENOTYPES[_code] = None
+
+# One C-level pass for multi-character cells: upper-case a/c/g/t/n, keep A/C/G/T/N
+# and delete every other ASCII character (separators like '/', '|', '\\', '-', ':')
+GENOTYPE_BASES = str.maketrans(
+    {chr(i): None for i in range(128) if chr(i) not in "ACGTNacgtn"} | {c: c.upper() for c in "acgtn"}
+)
+
+
 def normalize_genotype_raw(gt_raw: str):
     """Normalize a raw HapMap genotype cell to a tuple of alleles (a1, a2).
 
@@ -81,175 +133,547 @@ def normalize_genotype_raw(gt_raw: str):
     """
     if gt_raw is None:
         return None
-    s = str(gt_raw).strip().upper()
-    if s == "" or s == "NA":
-        return None
-
-    # Single-character IUPAC handling
-    if len(s) == 1 and s.isalpha():
-        if s in IUPAC_MAP:
-            bases = IUPAC_MAP[s]
-            if len(bases) == 1:
-                b = next(iter(bases))
-                return (b, b)
-            elif len(bases) == 2:
-                a1, a2 = sorted(list(bases))  # deterministic order
-                return (a1, a2)
-            else:
-                return None  # 0 or >2 -> treat as missing/ambiguous
-        # Unknown letter -> missing
-        return None
-
-    # Multi-character formats like "A/G", "AG", "N/N", "A|C"
-    cleaned = []
-    for ch in s:
-        if ch in {"A", "C", "G", "T", "N"}:
-            cleaned.append(ch)
-        # ignore separators like '/', '|', '\\', '-', ':'
+    s = str(gt_raw).strip()
+    if not s.isascii():
+        s = s.upper()  # rare: keep full Unicode case mapping
+
+    # Single-character IUPAC handling (unknown letters / non-letters -> missing)
+    if len(s) == 1:
+        return IUPAC_GENOTYPES.get(s.upper())
+
+    # Multi-character formats like "A/G", "AG", "N/N", "A|C" ("NA" falls out as N -> missing)
+    cleaned = s.translate(GENOTYPE_BASES)
+    if not cleaned.isascii():
+        cleaned = "".join(ch for ch in cleaned if ch in "ACGTN")
     if not cleaned:
         return None
     # Consider only first two base-like chars
     if len(cleaned) < 2:
         # If only one base and not N, duplicate it (homozygous)
-        if cleaned[0] in {"A", "C", "G", "T"}:
-            return (cleaned[0], cleaned[0])
+        if cleaned != "N":
+            return (cleaned, cleaned)
         return None
 
     a1, a2 = cleaned[0], cleaned[1]
     if a1 == "N" or a2 == "N":
         return None
-    if a1 not in {"A", "C", "G", "T"} or a2 not in {"A", "C", "G", "T"}:
-        return None
     return (a1, a2)
 
 
+IO_BUFFER_SIZE = 1 << 20  # 1 MiB file buffers
+WRITE_BATCH_SIZE = 4 << 20  # flush VCF rows roughly every 4 MiB of text
+READ_CHUNK_SIZE = 8 << 20  # HapMap body is split 8 MiB of the memory map at a time
+
+# Packed genotype code: high nibble = allele 1, low nibble = allele 2 (A=1, C=2, G=3, T=4).
+BASE_CODES = {"A": 1, "C": 2, "G": 3, "T": 4}
+MISSING_CODE = 0xFF
+
+CODE_TO_BASE = [None] * 16
+for _b, _c in BASE_CODES.items():
+    CODE_TO_BASE[_c] = _b
+
+# Observed-base bitmask per packed code: A=1, C=2, G=4, T=8 (MISSING_CODE -> 0)
+BASE_BITS = tuple((1 << (BASE_CODES[_b] - 1), _b) for _b in "ACGT")
+CODE_TO_BASE_MASK = [0] * 256
+for _c1 in BASE_CODES.values():
+    for _c2 in BASE_CODES.values():
+        CODE_TO_BASE_MASK[(_c1 << 4) | _c2] = (1 << (_c1 - 1)) | (1 << (_c2 - 1))
+CODE_TO_BASE_MASK_ARRAY = np.array(CODE_TO_BASE_MASK, dtype=np.uint8) if np is not None else None
+
+
+def encode_genotype(gt) -> int:
+    """Pack a normalized (a1, a2) tuple into one byte; None becomes MISSING_CODE."""
+    if gt is None:
+        return MISSING_CODE
+    return (BASE_CODES[gt[0]] << 4) | BASE_CODES[gt[1]]
+
+
+@lru_cache(maxsize=4096)
+def encode_genotype_cell(gt_raw: str) -> int:
+    """Packed code of one raw HapMap cell (cached: genotype cells have tiny cardinality)."""
+    return encode_genotype(normalize_genotype_raw(gt_raw))
+
+
+_GENOTYPE_LUTS = None
+
+
+def genotype_luts():
+    """Return (one_char_lut, two_char_lut) mapping raw ASCII cells to packed codes.
+
+    Built lazily from normalize_genotype_raw itself, so the vectorized path
+    decodes every 1- or 2-character cell exactly like the per-cell path.
+    """
+    global _GENOTYPE_LUTS
+    if _GENOTYPE_LUTS is None:
+        one = np.full(256, MISSING_CODE, dtype=np.uint8)
+        two = np.full(65536, MISSING_CODE, dtype=np.uint8)
+        for c1 in range(128):
+            one[c1] = encode_genotype(normalize_genotype_raw(chr(c1)))
+            for c2 in range(128):
+                two[(c1 << 8) | c2] = encode_genotype(normalize_genotype_raw(chr(c1) + chr(c2)))
+        _GENOTYPE_LUTS = (one, two)
+    return _GENOTYPE_LUTS
+
+
+def encode_genotype_cells(samples_field: bytes, out=None):
+    """Vectorized decoding of the tab-joined sample columns of one HapMap row.
+
+    Works on the raw bytes (no UTF-8 decode). Returns a uint8 array of packed
+    codes when NumPy is available, the bytes are ASCII and every cell is
+    exactly 1 or exactly 2 characters wide; otherwise
+    None, and the caller falls back to normalize_genotype_raw per cell.
+    If `out` has one slot per cell the codes are written into it instead of a
+    fresh array.
+    """
+    if np is None or not samples_field.isascii():
+        return None
+    raw = np.frombuffer(samples_field, dtype=np.uint8)
+    n_cells = samples_field.count(b"\t") + 1
+    one, two = genotype_luts()
+    if out is not None and out.size != n_cells:
+        out = None
+    if raw.size == 2 * n_cells - 1:
+        if n_cells > 1 and not (raw[1::2] == 9).all():
+            return None
+        return np.take(one, raw[0::2], out=out)
+    if raw.size == 3 * n_cells - 1:
+        if n_cells > 1 and not (raw[2::3] == 9).all():
+            return None
+        return np.take(two, (raw[0::3].astype(np.uint16) << 8) | raw[1::3], out=out)
+    return None
+
+
+def observed_base_mask(codes):
+    """Return (first_base, mask) for one row of packed genotype codes.
+
+    first_base is allele 1 of the first non-missing genotype (None if all are
+    missing); mask has bit A=1, C=2, G=4, T=8 set for every base seen on
+    either allele. Accepts a NumPy uint8 array or any iterable of ints.
+    """
+    if np is not None and isinstance(codes, np.ndarray):
+        mask = int(np.bitwise_or.reduce(CODE_TO_BASE_MASK_ARRAY[codes])) if codes.size else 0
+        if not mask:
+            return None, 0
+        return CODE_TO_BASE[int(codes[(codes != MISSING_CODE).argmax()]) >> 4], mask
+    mask = 0
+    for c in set(codes):
+        mask |= CODE_TO_BASE_MASK[c]
+    if not mask:
+        return None, 0
+    first = next(c for c in codes if c != MISSING_CODE)
+    return CODE_TO_BASE[first >> 4], mask
+
+
+@lru_cache(maxsize=None)
+def genotype_string_table(alleles: tuple) -> list:
+    """Return the 256-entry packed-code -> b"i/j" GT bytes table for a site.
+
+    `alleles` is (REF, ALT1, ALT2, ...); allele indices follow that order.
+    Codes whose alleles are not both REF/ALT (including MISSING_CODE) map to
+    "./.". Cached, since only a handful of REF/ALT layouts occur in practice.
+    """
+    table = [b"./."] * 256
+    indexed = [(BASE_CODES[b], i) for i, b in enumerate(alleles) if b in BASE_CODES]
+    for c1, i in indexed:
+        for c2, j in indexed:
+            table[(c1 << 4) | c2] = f"{i}/{j}".encode("ascii")
+    return table
+
+
+@lru_cache(maxsize=None)
+def genotype_string_array(alleles: tuple):
+    """genotype_string_table as a NumPy object array, for fancy indexing by codes."""
+    return np.array(genotype_string_table(alleles), dtype=object)
+
+
+@lru_cache(maxsize=None)
+def allowed_codes(alleles: tuple) -> frozenset:
+    """Packed codes whose two alleles are both in `alleles`, plus MISSING_CODE."""
+    bases = [BASE_CODES[b] for b in alleles if b in BASE_CODES]
+    return frozenset([MISSING_CODE] + [(c1 << 4) | c2 for c1 in bases for c2 in bases])
+
+
+@lru_cache(maxsize=None)
+def allowed_code_mask(alleles: tuple):
+    """allowed_codes as a 256-entry NumPy bool mask."""
+    mask = np.zeros(256, dtype=bool)
+    mask[list(allowed_codes(alleles))] = True
+    return mask
+
+
+def alleles_cover_codes(alleles: tuple, codes) -> bool:
+    """True if every non-missing genotype in `codes` uses only bases from `alleles`."""
+    if np is not None and isinstance(codes, np.ndarray):
+        return bool(allowed_code_mask(alleles)[codes].all())
+    return allowed_codes(alleles).issuperset(codes)
+
+
+@lru_cache(maxsize=None)
+def allele_index_by_nibble(alleles: tuple):
+    """Map each 4-bit base code to its REF/ALT index (-1 if not an allele), for the JIT kernel."""
+    index = np.full(16, -1, dtype=np.int8)
+    for i, b in enumerate(alleles):
+        if b in BASE_CODES:
+            index[BASE_CODES[b]] = i
+    return index
+
+
+_JIT = None
+
+
+def jit_kernels():
+    """Lazily load the optional Numba kernels from _hapmap_jit.py next to this file; None if Numba is missing.
+
+    The kernel module is loaded by path so it is found however this script was imported.
+    Only a missing numba falls back; any other error in the kernel module is raised.
+    """
+    global _JIT
+    if _JIT is None:
+        kernel_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_hapmap_jit.py")
+        spec = importlib.util.spec_from_file_location("_hapmap_jit", kernel_path)
+        module = importlib.util.module_from_spec(spec)
+        try:
+            spec.loader.exec_module(module)
+        except ImportError as exc:
+            if exc.name != "numba":
+                raise
+            module = False
+        _JIT = module
+    return _JIT or None
+
+
 def write_vcf_header(out_fh, sample_ids):
-    out_fh.write("##fileformat=VCFv4.2\n")
-    out_fh.write(f"##source=hapmap_to_vcf.py ({datetime.now(timezone.utc).isoformat()})\n")
-    out_fh.write("##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">\n")
-    header_cols = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
-    header_cols.extend(sample_ids)
-    out_fh.write("\t".join(header_cols) + "\n")
-
-
-def convert_hapmap_to_vcf(hapmap_path: str, vcf_path: str):
-    with open(hapmap_path, "r", encoding="utf-8") as hin, open(vcf_path, "w", encoding="utf-8") as hout:
-        header = hin.readline()
-        if not header:
-            raise ValueError("Empty HapMap file.")
-        header_fields = header.rstrip("\n\r").split("\t")
-        if len(header_fields) < 12 or header_fields[0].lower().startswith("rs#") is False:
-            # Some HapMap headers may not start with 'rs#' exactly; do a looser check
-            # but still expect at least 12 columns
-            if len(header_fields) < 12:
-                raise ValueError("Unexpected HapMap header: fewer than 12 columns.")
-
-        # Standard HapMap: first 11 metadata columns, samples start at index 11
-        sample_ids = header_fields[11:]
-        write_vcf_header(hout, sample_ids)
+    samples_joined = "\t".join(sample_ids)
+    out_fh.write(
+        "##fileformat=VCFv4.2\n"
+        f"##source=hapmap_to_vcf.py ({datetime.now(timezone.utc).isoformat()})\n"
+        "##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">\n"
+        f"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{samples_joined}\n".encode("utf-8")
+    )
 
-        line_num = 1
-        for line in hin:
-            line_num += 1
-            if not line.strip():
-                continue
-            fields = line.rstrip("\n\r").split("\t")
-            if len(fields) < 12:
-                # Skip malformed lines
+
+def read_hapmap_header(hapmap_path: str):
+    """Read the HapMap header line.
+
+    Returns (header_fields, data_start), where data_start is the byte offset of
+    the first data line. Lines may end in LF, CRLF or a bare CR.
+    """
+    with open(hapmap_path, "rb") as hin:
+        raw = hin.readline()
+    if not raw:
+        raise ValueError("Empty HapMap file.")
+    text = raw.decode("utf-8").rstrip("\n")
+    header, cr, rest = text.partition("\r")
+    data_start = len(raw) if not rest else len(header.encode("utf-8")) + 1
+    header_fields = header.split("\t")
+    if len(header_fields) < 12 or header_fields[0].lower().startswith("rs#") is False:
+        # Some HapMap headers may not start with 'rs#' exactly; do a looser check
+        # but still expect at least 12 columns
+        if len(header_fields) < 12:
+            raise ValueError("Unexpected HapMap header: fewer than 12 columns.")
+    return header_fields, data_start
+
+
+def split_byte_ranges(hapmap_path: str, start: int, n_parts: int) -> list:
+    """Split [start, EOF) into up to n_parts (begin, end) ranges on line boundaries."""
+    size = os.path.getsize(hapmap_path)
+    bounds = [start]
+    with open(hapmap_path, "rb") as hin:
+        for k in range(1, n_parts):
+            pos = start + (size - start) * k // n_parts
+            if pos <= bounds[-1]:
                 continue
+            # Move to the first line start at or after pos
+            hin.seek(pos - 1)
+            hin.readline()
+            bounds.append(min(hin.tell(), size))
+    bounds.append(size)
+    return [(b, e) for b, e in zip(bounds, bounds[1:]) if e > b]
+
+
+def split_lines(data: bytes) -> list:
+    """Split raw bytes on LF, CRLF or bare CR (universal newlines), without terminators."""
+    lines = data.split(b"\n")
+    if b"\r" not in data:
+        return lines
+    out = []
+    for line in lines:
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        if b"\r" in line:
+            out.extend(line.split(b"\r"))
+        else:
+            out.append(line)
+    return out
+
+
+def iter_range_lines(hapmap_path: str, start: int, end: int):
+    """Yield raw data lines (bytes, terminators stripped) from the byte range [start, end).
+
+    The file is memory-mapped read-only; each READ_CHUNK_SIZE window is cut at
+    its last LF and split in one go, so no partial line has to be carried.
+    """
+    with open(hapmap_path, "rb") as hin, mmap.mmap(hin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = start
+        while pos < end:
+            stop = min(pos + READ_CHUNK_SIZE, end)
+            cut = mm.rfind(b"\n", pos, stop) + 1
+            if cut <= pos:
+                # No LF inside the window (very long line): extend to the next LF
+                nl = mm.find(b"\n", stop, end)
+                cut = end if nl < 0 else nl + 1
+            chunk = mm[pos:cut]
+            lines = split_lines(chunk)
+            if chunk.endswith(b"\n"):
+                lines.pop()  # empty piece after the final LF
+            yield from lines
+            pos = cut
+
+
+def select_samples(codes, keep: list) -> bytearray:
+    """Subset one row's packed codes to the kept sample columns, in `keep` order.
+
+    Cells missing from a short row count as missing genotypes.
+    """
+    n = len(codes)
+    return bytearray(codes[i] if i < n else MISSING_CODE for i in keep)
+
 
-            rs_id = fields[0]
-            alleles_raw = fields[1]
-            chrom = fields[2]
-            pos = fields[3]
-            # fields[4]..fields[10] are not used for VCF minimal output
-            sample_gts_raw = fields[11:]
+def convert_lines(lines, n_samples: int, out_fh, trust_alleles: bool = False,
+                  keep: list | None = None, chunksize: int | None = None):
+    """Convert raw HapMap data lines (bytes) to VCF rows written to out_fh (binary mode).
 
-            # Parse REF/ALT candidates from alleles field
-            allele_order = parse_alleles_field(alleles_raw)
+    Sites whose genotypes only use bases from the Alleles column take them as
+    REF/ALT directly. With trust_alleles=True that check is skipped as well,
+    and genotypes with other bases are written as "./.".
+    `keep` lists the sample column indices to output (None = all); REF/ALT are
+    then decided from those samples only. With `chunksize`, buffered rows are
+    written and out_fh is flushed every `chunksize` rows.
+    """
+    # Reused per row by the vectorized decoder (one packed byte per sample)
+    gt_codes = np.empty(n_samples, dtype=np.uint8) if np is not None else None
+    keep_arr = np.array(keep, dtype=np.intp) if keep is not None and np is not None else None
+    keep_max = max(keep) if keep else -1
+    jit = jit_kernels() if np is not None else None
+    array_type = np.ndarray if np is not None else ()  # isinstance(x, ()) is always False
+
+    # Bind hot-loop globals to locals (LOAD_FAST instead of LOAD_GLOBAL); matters most
+    # on the pure-Python path without NumPy
+    _encode_cells = encode_genotype_cells
+    _encode_cell = encode_genotype_cell
+    _parse_alleles = parse_alleles_field
+    _covers = alleles_cover_codes
+    _observed = observed_base_mask
+    _gt_table = genotype_string_table
+    _gt_array = genotype_string_array
+    _base_bits = BASE_BITS
+
+    out_batch = []
+    out_batch_size = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        # Split off the 11 metadata columns only; sample cells stay joined for vectorized decoding
+        fields = line.split(b"\t", 11)
+        if len(fields) < 12:
+            # Skip malformed lines
+            continue
+
+        rs_id = fields[0]
+        alleles_raw = fields[1].decode("utf-8")
+        chrom = fields[2]
+        pos = fields[3]
+        # fields[4]..fields[10] are not used for VCF minimal output
+        codes = _encode_cells(fields[11], out=gt_codes)
+        if codes is None:
+            codes = bytearray(map(_encode_cell, fields[11].decode("utf-8").split("\t")))
+        is_array = isinstance(codes, array_type)
+        if keep is not None:
+            if is_array and codes.size > keep_max:
+                codes = codes[keep_arr]
+            else:
+                codes = select_samples(codes, keep)
+                is_array = False
+
+        # Parse REF/ALT candidates from alleles field
+        allele_order = _parse_alleles(alleles_raw)
+
+        if allele_order and (trust_alleles or _covers(allele_order, codes)):
+            # Single pass: the Alleles column already lists every observed base,
+            # which is exactly what the two-pass discovery below would return
+            ref_base = allele_order[0]
+            alt_list = allele_order[1:]
+        else:
+            # Two passes: collect observed alleles from the packed genotype codes as a bitmask
+            first_base, observed_mask = _observed(codes)
             if allele_order:
                 ref_base = allele_order[0]
-                alt_candidates = allele_order[1:]
             else:
                 # Fallback: infer REF from the first non-missing genotype allele we see
-                ref_base = None
-                alt_candidates = []
-
-            # First pass: normalize all genotypes and collect observed alleles
-            normalized_gts = []
-            observed_alts = set(alt_candidates)
-
-            for gt_raw in sample_gts_raw:
-                gt = normalize_genotype_raw(gt_raw)
-                normalized_gts.append(gt)
-                if gt is None:
-                    continue
-                a1, a2 = gt
-                if ref_base is None and a1 in {"A", "C", "G", "T"}:
-                    ref_base = a1
-                if ref_base is None and a2 in {"A", "C", "G", "T"}:
-                    ref_base = a2
-                # Collect ALTs distinct from REF
-                if a1 in {"A", "C", "G", "T"}:
-                    if ref_base is not None and a1 != ref_base:
-                        observed_alts.add(a1)
-                if a2 in {"A", "C", "G", "T"}:
-                    if ref_base is not None and a2 != ref_base:
-                        observed_alts.add(a2)
+                ref_base = first_base
 
             if ref_base is None:
                 # If we still cannot decide REF, default to 'N' and mark site missing
                 ref_base = "N"
 
-            # Build ALT list in deterministic order
-            alt_list = [a for a in allele_order[1:] if a in observed_alts]
-            for a in sorted(observed_alts):
-                if a not in alt_list:
-                    alt_list.append(a)
-
-            # Create allele index mapping for GT encoding
-            allele_to_index = {ref_base: 0}
-            for idx, alt in enumerate(alt_list, start=1):
-                allele_to_index[alt] = idx
-
-            # If no ALT (monomorphic), VCF expects '.' in ALT column
-            alt_field = ",".join(alt_list) if alt_list else "."
-
-            # Encode genotypes
-            gt_strings = []
-            for gt in normalized_gts:
-                if gt is None:
-                    gt_strings.append("./.")
-                else:
-                    a1, a2 = gt
-                    if a1 not in allele_to_index or a2 not in allele_to_index:
-                        gt_strings.append("./.")
-                    else:
-                        g = f"{allele_to_index[a1]}/{allele_to_index[a2]}"
-                        gt_strings.append(g)
-
-            # Compose VCF line
-            chrom_field = str(chrom)
-            pos_field = str(pos)
-            id_field = rs_id if rs_id != "." else "."
-            ref_field = ref_base
-            qual_field = "."
-            filter_field = "PASS"
-            info_field = "."
-            format_field = "GT"
-
-            row = [
-                chrom_field,
-                pos_field,
-                id_field,
-                ref_field,
-                alt_field,
-                qual_field,
-                filter_field,
-                info_field,
-                format_field,
-            ] + gt_strings
-            hout.write("\t".join(row) + "\n")
+            # Build ALT list in deterministic order: Alleles-column ALTs first,
+            # then any other observed bases in A, C, G, T order
+            alt_list = list(allele_order[1:])
+            for bit, base in _base_bits:
+                if observed_mask & bit and base != ref_base and base not in alt_list:
+                    alt_list.append(base)
+
+        # If no ALT (monomorphic), VCF expects '.' in ALT column
+        alt_field = ",".join(alt_list).encode("ascii") if alt_list else b"."
+
+        # Encode genotypes through the cached code-indexed string table (REF=0, ALTs=1..)
+        alleles = (ref_base, *alt_list)
+        if is_array and jit is not None:
+            gt_strings = [jit.encode_site(codes, allele_index_by_nibble(alleles)).tobytes()]
+        elif is_array:
+            gt_strings = _gt_array(alleles)[codes].tolist()
+        else:
+            gt_strings = list(map(_gt_table(alleles).__getitem__, codes))
+
+        # Compose VCF line (bytes end to end; metadata fields pass through undecoded)
+        chrom_field = chrom
+        pos_field = pos
+        id_field = rs_id if rs_id != b"." else b"."
+        ref_field = ref_base.encode("ascii")
+        qual_field = b"."
+        filter_field = b"PASS"
+        info_field = b"."
+        format_field = b"GT"
+
+        row = [
+            chrom_field,
+            pos_field,
+            id_field,
+            ref_field,
+            alt_field,
+            qual_field,
+            filter_field,
+            info_field,
+            format_field,
+        ] + gt_strings
+        out_line = b"\t".join(row) + b"\n"
+        out_batch.append(out_line)
+        out_batch_size += len(out_line)
+        if chunksize and len(out_batch) >= chunksize:
+            out_fh.write(b"".join(out_batch))
+            out_fh.flush()
+            out_batch.clear()
+            out_batch_size = 0
+        elif out_batch_size >= WRITE_BATCH_SIZE:
+            out_fh.write(b"".join(out_batch))
+            out_batch.clear()
+            out_batch_size = 0
+
+    out_fh.write(b"".join(out_batch))
+
+
+COMPRESSED_SUFFIXES = (".gz", ".bgz")
+
+
+def is_compressed_output(vcf_path: str) -> bool:
+    """True if the output path asks for compressed VCF (.gz / .bgz)."""
+    return vcf_path.lower().endswith(COMPRESSED_SUFFIXES)
+
+
+def open_vcf_output(vcf_path: str):
+    """Open the VCF output for binary writing (rows are written as LF-terminated bytes).
+
+    .vcf.gz / .vcf.bgz paths are compressed: BGZF via pysam when installed
+    (readable by bcftools/plink2 and indexable with tabix), otherwise plain
+    gzip at compresslevel=1.
+    """
+    if not is_compressed_output(vcf_path):
+        return open(vcf_path, "wb", buffering=IO_BUFFER_SIZE)
+    if pysam is not None:
+        return pysam.BGZFile(vcf_path, "wb")
+    return gzip.open(vcf_path, "wb", compresslevel=1)
+
+
+def index_vcf(vcf_path: str) -> bool:
+    """Build a tabix index (.tbi) for a BGZF-compressed VCF; False if pysam is unavailable."""
+    if pysam is None or not is_compressed_output(vcf_path):
+        return False
+    pysam.tabix_index(vcf_path, preset="vcf", force=True)
+    return True
+
+
+def convert_range_to_file(hapmap_path: str, start: int, end: int, n_samples: int, part_path: str,
+                          trust_alleles: bool = False, keep: list | None = None,
+                          chunksize: int | None = None) -> str:
+    """Worker entry point: convert one byte range of the HapMap body into a part file."""
+    with open(part_path, "wb", buffering=IO_BUFFER_SIZE) as out_fh:
+        convert_lines(iter_range_lines(hapmap_path, start, end), n_samples, out_fh, trust_alleles, keep, chunksize)
+    return part_path
+
+
+def convert_hapmap_to_vcf(hapmap_path: str, vcf_path: str, threads: int = 1, trust_alleles: bool = False,
+                          samples: list | None = None, chunksize: int | None = None):
+    """Convert a HapMap file to VCF.
+
+    With threads > 1 the body is split into byte ranges on line boundaries,
+    converted by a process pool into temporary part files, and concatenated
+    in input order, so the output is identical to the single-process run.
+    `samples` restricts (and orders) the output sample columns; `chunksize`
+    flushes the output every N rows.
+    """
+    header_fields, data_start = read_hapmap_header(hapmap_path)
+    # Standard HapMap: first 11 metadata columns, samples start at index 11
+    sample_ids = header_fields[11:]
+    n_samples = len(sample_ids)
+    keep = None
+    if samples:
+        column = {}
+        for i, sid in enumerate(sample_ids):
+            column.setdefault(sid, i)
+        missing = [sid for sid in samples if sid not in column]
+        if missing:
+            raise ValueError(f"Samples not found in HapMap header: {', '.join(missing)}")
+        keep = [column[sid] for sid in samples]
+        sample_ids = list(samples)
+    ranges = split_byte_ranges(hapmap_path, data_start, max(1, threads))
+
+    with open_vcf_output(vcf_path) as hout:
+        write_vcf_header(hout, sample_ids)
+        if len(ranges) <= 1:
+            for start, end in ranges:
+                convert_lines(iter_range_lines(hapmap_path, start, end), n_samples, hout, trust_alleles, keep, chunksize)
+            return
+
+        out_dir = os.path.dirname(os.path.abspath(vcf_path))
+        part_paths = []
+        try:
+            for _ in ranges:
+                fd, part_path = tempfile.mkstemp(suffix=".vcf.part", dir=out_dir)
+                os.close(fd)
+                part_paths.append(part_path)
+            with ProcessPoolExecutor(max_workers=min(threads, len(ranges))) as pool:
+                futures = [
+                    pool.submit(convert_range_to_file, hapmap_path, start, end, n_samples, part_path,
+                                trust_alleles, keep, chunksize)
+                    for (start, end), part_path in zip(ranges, part_paths)
+                ]
+                for fut in futures:
+                    with open(fut.result(), "rb") as part:
+                        shutil.copyfileobj(part, hout, IO_BUFFER_SIZE)
+        finally:
+            for part_path in part_paths:
+                try:
+                    os.remove(part_path)
+                except OSError:
+                    pass
+
+
+def parse_sample_list(value: str) -> list:
+    """argparse 类型：解析逗号分隔的样本 ID 列表。"""
+    samples = [s.strip() for s in value.split(",") if s.strip()]
+    if not samples:
+        raise argparse.ArgumentTypeError("样本列表为空")
+    return samples
 
 
 def main():
@@ -258,30 +682,62 @@ def main():
     default_input = os.path.join(script_dir, "origin_maize.geno.selected.hmp.txt")
     default_output = os.path.join(script_dir, "origin_maize.geno.selected.vcf")
 
-    # 支持命令行参数覆盖：python hapmap_to_vcf.py <input_hmp.txt> <output.vcf>
-    if len(sys.argv) >= 3:
-        input_path = sys.argv[1]
-        output_path = sys.argv[2]
-    else:
-        input_path = default_input
-        output_path = default_output
+    # 支持命令行参数覆盖：python hapmap_to_vcf.py [input_hmp.txt] [output.vcf] [--threads N]
+    parser = argparse.ArgumentParser(description="将 HapMap(hmp.txt) 转换为 VCFv4.2。")
+    parser.add_argument("input", nargs="?", default=default_input, help="输入 HapMap 文件（默认脚本目录下的示例文件）")
+    parser.add_argument("output", nargs="?", default=default_output, help="输出 VCF 文件")
+    parser.add_argument("--threads", type=int, default=1, help="并行转换的进程数（按字节区间切分输入，默认 1）")
+    parser.add_argument("--trust-alleles", action="store_true",
+                        help="直接以 Alleles 列作为 REF/ALT，跳过基因型一致性检查；列外碱基的基因型输出为 ./.")
+    parser.add_argument("--tabix", action="store_true",
+                        help="输出为 .vcf.gz/.vcf.bgz 时额外建立 tabix 索引（需要 pysam）")
+    parser.add_argument("--samples", type=parse_sample_list, default=None,
+                        help="仅输出这些样本（逗号分隔的样本 ID，按给定顺序），如 S1,S2,S3")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="每转换 N 行即写出并刷新输出，便于下游流式读取（默认按 4 MiB 批量写出）")
+    args = parser.parse_args()
+    input_path = args.input
+    output_path = args.output
 
     if not os.path.isfile(input_path):
         print(f"[Error] 输入文件不存在: {input_path}")
         sys.exit(1)
+    if args.threads < 1:
+        print(f"[Error] --threads 必须为正整数: {args.threads}")
+        sys.exit(1)
+    if args.chunksize is not None and args.chunksize < 1:
+        print(f"[Error] --chunksize 必须为正整数: {args.chunksize}")
+        sys.exit(1)
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
     print(f"[Info] 读取 HapMap: {input_path}")
     print(f"[Info] 写入 VCF:   {output_path}")
     try:
-        convert_hapmap_to_vcf(input_path, output_path)
+        convert_hapmap_to_vcf(
+            input_path,
+            output_path,
+            threads=args.threads,
+            trust_alleles=args.trust_alleles,
+            samples=args.samples,
+            chunksize=args.chunksize,
+        )
     except Exception as e:
         print(f"[Error] 转换失败: {e}")
         sys.exit(1)
+    if args.tabix:
+        try:
+            indexed = index_vcf(output_path)
+        except Exception as e:
+            print(f"[Error] 建立 tabix 索引失败（需按染色体/位置排序）: {e}")
+            sys.exit(1)
+        if indexed:
+            print(f"[Info] 已建立 tabix 索引: {output_path}.tbi")
+        else:
+            print("[Info] 未建立 tabix 索引：需要 pysam，且输出文件以 .gz/.bgz 结尾")
     print("[Done] 转换完成")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -3,6 +3,10 @@ r"""
 
 功能：
 - 使用 Python 内置 csv 库按流式读取 CSV，写出为制表符分隔的 TSV；
+- 快速路径：若文件不含引号、制表符与单独的回车符（常见的表型表），直接按字节块把逗号替换为制表符，
+  不逐字段解析；一旦发现上述字符即自动回退；
+- 若已安装 pyarrow，含引号字段的文件改用 pyarrow.csv 的 C++ 解析器分块转换；结果无法与 csv 库一致时
+  （单列、列数不一致、空行、字段需加引号等）再回退到 csv 库逐行转换，输出始终与 csv 库完全一致；
 - 默认输入/输出路径已设置，可用命令行参数覆盖；
 - 自动处理 UTF-8 BOM（默认使用 utf-8-sig 读取）。
 
@@ -13,15 +17,141 @@ r"""
 """
 
 import argparse
+import codecs
 import os
 import sys
 import csv
 
+try:  # 可选：pyarrow 的 C++ CSV 解析器，用于含引号字段的大文件
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+def starts_with_bom(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(UTF8_BOM)) == UTF8_BOM
+
+
+def convert_csv_to_tsv_fast(input_csv: str, output_tsv: str, strip_bom: bool = True, chunk_size: int = 1 << 20) -> bool:
+    """按 1 MiB 字节块将逗号替换为制表符（CRLF 统一为 LF），不解析字段。
+
+    仅当文件不含引号、制表符与单独的回车符时与 csv 库的结果一致；遇到这些字符或非 UTF-8 字节立即返回 False，
+    由调用方改用 csv 库重新转换（会覆盖已写出的部分内容）。成功返回 True。
+    """
+    # 增量校验 UTF-8（多字节字符可跨块），与 csv 库按 UTF-8 读取时的报错行为保持一致
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(input_csv, "rb") as fin, open(output_tsv, "wb") as fout:
+        if not (strip_bom and fin.read(len(UTF8_BOM)) == UTF8_BOM):
+            fin.seek(0)
+        carry = b""
+        last = b"\n"
+        while True:
+            chunk = fin.read(chunk_size)
+            if not chunk:
+                break
+            # 纯 ASCII 块必为合法 UTF-8，跳过解码；上一块遗留的不完整多字节序列仍保存在 decoder 中，
+            # 会在下一个非 ASCII 块或文件末尾 final=True 时报错
+            if not chunk.isascii():
+                try:
+                    decoder.decode(chunk)
+                except UnicodeDecodeError:
+                    return False
+            buf = carry + chunk
+            # 块末尾的 \r 可能与下一块开头的 \n 组成 CRLF，留到下一块处理
+            carry = b""
+            if buf.endswith(b"\r"):
+                buf, carry = buf[:-1], b"\r"
+            if b'"' in buf or b"\t" in buf:
+                return False
+            crlf = buf.count(b"\r\n")
+            if buf.count(b"\r") != crlf:
+                return False
+            if crlf:
+                buf = buf.replace(b"\r\n", b"\n")
+            if buf:
+                fout.write(buf.replace(b",", b"\t"))
+                last = buf[-1:]
+        if carry:
+            return False
+        try:
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return False
+        if last != b"\n":
+            fout.write(b"\n")
+    return True
+
+
+def has_blank_line(path: str, chunk_size: int = 1 << 20) -> bool:
+    """判断文件中是否存在空行（LF/CRLF/CR 均可；引号字段内的空行也算，宁可保守）。"""
+    with open(path, "rb") as f:
+        head = f.read(len(UTF8_BOM))
+        if head == UTF8_BOM:
+            head = f.read(1)
+        if head[:1] in (b"\n", b"\r"):
+            return True
+        buf = head
+        while True:
+            if b"\n\n" in buf or b"\r\r" in buf or b"\n\r" in buf:
+                return True
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            buf = buf[-1:] + chunk
+
+
+def convert_csv_to_tsv_arrow(input_csv: str, output_tsv: str, block_size: int = 4 << 20) -> bool:
+    """用 pyarrow.csv 流式解析 CSV（全部列按字符串读取），按 4 MiB 块写出 TSV。
+
+    适用于快速路径无法处理的含引号字段的文件。仅当结果可与 csv 库逐字节一致时才写出：
+    要求至少 2 列、各行列数一致且无空行、字段内不含制表符/引号/换行（写出时无需加引号）；
+    否则（或解析出错）返回 False，由调用方改用 csv 库重新转换。成功返回 True。
+    """
+    if pa is None or has_blank_line(input_csv):
+        return False
+    read_options = pacsv.ReadOptions(autogenerate_column_names=True, block_size=block_size)
+    parse_options = pacsv.ParseOptions(delimiter=",", quote_char='"', newlines_in_values=True, ignore_empty_lines=False)
+    try:
+        # 先读取首块确定列数，再以全字符串列类型重新打开，避免数值被重新格式化
+        names = pacsv.open_csv(input_csv, read_options=read_options, parse_options=parse_options).schema.names
+        if len(names) < 2:
+            return False
+        convert_options = pacsv.ConvertOptions(
+            column_types={name: pa.string() for name in names},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        )
+        reader = pacsv.open_csv(input_csv, read_options=read_options, parse_options=parse_options,
+                                convert_options=convert_options)
+        write_options = pacsv.WriteOptions(include_header=False, delimiter="\t", quoting_style="none")
+        with pacsv.CSVWriter(output_tsv, reader.schema, write_options=write_options) as writer:
+            for batch in reader:
+                for column in batch.columns:
+                    if pc.any(pc.match_substring_regex(column, '[\t"\r\n]')).as_py():
+                        return False
+                writer.write_batch(batch)
+    except (pa.ArrowInvalid, OSError):
+        return False
+    return True
+
 
 def convert_csv_to_tsv(input_csv: str, output_tsv: str, encoding: str = "utf-8-sig") -> None:
-    """将 CSV 转换为 TSV（流式处理，适合大文件）。"""
-    with open(input_csv, "r", encoding=encoding, newline="") as fin, \
-         open(output_tsv, "w", encoding="utf-8", newline="") as fout:
+    """将 CSV 转换为 TSV（流式处理，适合大文件）；UTF-8 输入优先尝试字节级快速路径。"""
+    if encoding.lower().replace("_", "-") in {"utf-8", "utf8", "utf-8-sig", "utf8-sig"}:
+        strip_bom = encoding.lower().replace("_", "-").endswith("sig")
+        if convert_csv_to_tsv_fast(input_csv, output_tsv, strip_bom=strip_bom):
+            return
+        # pyarrow 总会跳过 UTF-8 BOM，因此 utf-8（不去 BOM）且文件带 BOM 时不走该路径
+        if strip_bom or not starts_with_bom(input_csv):
+            if convert_csv_to_tsv_arrow(input_csv, output_tsv):
+                return
+    with open(input_csv, "r", encoding=encoding, newline="", buffering=1 << 20) as fin, \
+         open(output_tsv, "w", encoding="utf-8", newline="", buffering=1 << 20) as fout:
         reader = csv.reader(fin, delimiter=",", quotechar='"')
         writer = csv.writer(fout, delimiter="\t", quotechar='"', lineterminator="\n")
         for row in reader: